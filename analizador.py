@@ -0,0 +1,304 @@
+"""Análisis offline de logs/turnero_*.log.
+
+Lee los logs línea por línea (también .gz) y guarda sólo agregados y el estado de los
+intentos abiertos, así que la memoria no crece con el tamaño del archivo de logs.
+
+    python analizador.py                      # todos los logs de config.LOG_DIR
+    python analizador.py logs/ viejos/*.log.gz --timelines
+"""
+
+import argparse
+import ast
+import gzip
+import re
+import sys
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+
+import config
+
+RE_LINEA = re.compile(r"^(\d{4}-\d\d-\d\d \d\d:\d\d:\d\d,\d{3}) \[(\w+)\] (.*)$")
+RE_CUENTA = re.compile(r"^\[([^\]]+)\] (.*)$")
+RE_INICIO = re.compile(r"^=== Intentando sacar turno para usuario: (.+) ===$")
+RE_RESULTADO = re.compile(r"^Resultado: (\w+)")
+RE_FASE = re.compile(r"^Fase (\w+): ([\d.]+)s$")
+RE_EXCEPCION = re.compile(r"^([\w.]*(?:Error|Exception|Exit|Interrupt|error)\w*): (.*)$")
+
+SELECTOR_HIT = [
+    re.compile(r"^Click en '(.+)' dentro de "),
+    re.compile(r"^Fill '(.+)' en frame "),
+    re.compile(r"^Force-filled '(.+)' en frame "),
+    re.compile(r"^\d+ botones encontrados con selector (.+)$"),
+]
+SELECTOR_MISS = [
+    re.compile(r"^No se pudo clickear selector: (.+)$"),
+    re.compile(r"^Elemento opcional no encontrado: (.+)$"),
+    re.compile(r"^Ningún selector funcionó: (.+)$"),
+    re.compile(r"^No se pudo clickear con ningún selector en ningún frame: (.+)$"),
+    re.compile(r"^No se encontró selector: (.+)$"),
+    re.compile(r"^No se pudo llenar ningún selector: (.+)$"),
+    re.compile(r"^No se pudo llenar selectores en frame \S+: (.+)$"),
+    re.compile(r"^Timeout esperando selectores (.+) en algún frame$"),
+]
+
+# Para logs anteriores a las líneas "Fase X: Ns": mensaje que marca el inicio de cada fase.
+MARCADORES_FASE = [
+    (re.compile(r"^Click en '.*Continu.*' dentro de "), "login"),
+    (re.compile(r"^Click en '.*(LoginConfirm|SignInConfirm|Acceder).*' dentro de "), "espera_turnos"),
+    (re.compile(r"^(Tabla de turnos detectada|Servicio visible)"), "seleccion"),
+    (re.compile(r"^Elegiendo botón de turno"), "confirmacion"),
+]
+
+BUCKETS = config.METRICAS_BUCKETS_FASE
+
+
+def _ts(texto: str) -> datetime:
+    return datetime.strptime(texto, "%Y-%m-%d %H:%M:%S,%f")
+
+
+def _normalizar(mensaje: str) -> str:
+    """Saca de un mensaje lo que cambia entre ocurrencias (números, URLs, comillas)."""
+    mensaje = re.sub(r"https?://\S+", "<url>", mensaje)
+    mensaje = re.sub(r"(?:[A-Za-z]:)?(?:[/\\][\w.\-]+){2,}", "<ruta>", mensaje)
+    mensaje = re.sub(r"'[^']*'", "'…'", mensaje)
+    mensaje = re.sub(r"\d+", "N", mensaje)
+    return mensaje[:160]
+
+
+def _lista_selectores(texto: str) -> list[str]:
+    try:
+        valor = ast.literal_eval(texto)
+    except (ValueError, SyntaxError):
+        return [texto]
+    return [str(v) for v in valor] if isinstance(valor, list) else [str(valor)]
+
+
+@dataclass
+class _Stats:
+    n: int = 0
+    suma: float = 0.0
+    minimo: float = float("inf")
+    maximo: float = 0.0
+    buckets: list[int] = field(default_factory=lambda: [0] * (len(BUCKETS) + 1))
+
+    def agregar(self, valor: float):
+        self.n += 1
+        self.suma += valor
+        self.minimo = min(self.minimo, valor)
+        self.maximo = max(self.maximo, valor)
+        for i, limite in enumerate(BUCKETS):
+            if valor <= limite:
+                self.buckets[i] += 1
+                return
+        self.buckets[-1] += 1
+
+    def percentil(self, p: float) -> float:
+        """Cota superior del percentil p según el bucket en el que cae."""
+        objetivo = p * self.n
+        acumulado = 0
+        for i, n in enumerate(self.buckets):
+            acumulado += n
+            if acumulado >= objetivo:
+                return min(BUCKETS[i], self.maximo) if i < len(BUCKETS) else self.maximo
+        return self.maximo
+
+
+@dataclass
+class _Intento:
+    inicio: datetime
+    fase: str = "navegacion"
+    fase_desde: datetime | None = None
+    fases_inferidas: list[tuple[str, float]] = field(default_factory=list)
+    fases_explicitas: list[tuple[str, float]] = field(default_factory=list)
+
+    def cambiar_fase(self, fase: str, ts: datetime):
+        desde = self.fase_desde or self.inicio
+        self.fases_inferidas.append((self.fase, (ts - desde).total_seconds()))
+        self.fase = fase
+        self.fase_desde = ts
+
+    def fases(self, fin: datetime) -> list[tuple[str, float]]:
+        if self.fases_explicitas:
+            return self.fases_explicitas
+        desde = self.fase_desde or self.inicio
+        return self.fases_inferidas + [(self.fase, (fin - desde).total_seconds())]
+
+
+class Analizador:
+    def __init__(self, timelines: bool = False, salida=sys.stdout):
+        self.timelines = timelines
+        self.salida = salida
+        self.fases: dict[str, _Stats] = defaultdict(_Stats)
+        self.selectores: dict[str, list[int]] = defaultdict(lambda: [0, 0])
+        self.excepciones: Counter = Counter()
+        self.resultados: Counter = Counter()
+        self.corridas = 0
+
+    def procesar_archivo(self, path: Path):
+        abrir = gzip.open if path.suffix == ".gz" else open
+        intentos: dict[str, _Intento] = {}
+        resultados: Counter = Counter()
+        fases_corrida: dict[str, _Stats] = defaultdict(_Stats)
+        error_pendiente: str | None = None
+        excepcion_pendiente: str | None = None
+        primero = ultimo = None
+
+        def _cerrar_error():
+            nonlocal error_pendiente, excepcion_pendiente
+            if error_pendiente is not None:
+                firma = error_pendiente
+                if excepcion_pendiente:
+                    firma = f"{excepcion_pendiente} | {firma}"
+                self.excepciones[firma] += 1
+            error_pendiente = excepcion_pendiente = None
+
+        with abrir(path, "rt", encoding="utf-8", errors="replace") as fh:
+            for linea in fh:
+                linea = linea.rstrip("\n")
+                m = RE_LINEA.match(linea)
+                if not m:
+                    exc = RE_EXCEPCION.match(linea.strip())
+                    if exc and error_pendiente is not None:
+                        excepcion_pendiente = exc.group(1).rsplit(".", 1)[-1]
+                    continue
+
+                _cerrar_error()
+                ts = _ts(m.group(1))
+                nivel, mensaje = m.group(2), m.group(3)
+                primero = primero or ts
+                ultimo = ts
+
+                inicio = RE_INICIO.match(mensaje)
+                if inicio:
+                    intentos[inicio.group(1)] = _Intento(inicio=ts)
+                    continue
+
+                cuenta = RE_CUENTA.match(mensaje)
+                usuario, cuerpo = (cuenta.group(1), cuenta.group(2)) if cuenta else (None, mensaje)
+
+                if nivel in ("ERROR", "CRITICAL"):
+                    error_pendiente = _normalizar(cuerpo)
+
+                self._contar_selectores(cuerpo)
+
+                intento = intentos.get(usuario) if usuario else None
+                fase = RE_FASE.match(cuerpo)
+                if fase and intento:
+                    intento.fases_explicitas.append((fase.group(1), float(fase.group(2))))
+                    continue
+
+                resultado = RE_RESULTADO.match(cuerpo)
+                if resultado and usuario:
+                    resultados[resultado.group(1)] += 1
+                    intento = intentos.pop(usuario, None)
+                    if intento:
+                        self._cerrar_intento(path, usuario, intento, ts, resultado.group(1), fases_corrida)
+                    continue
+
+                if intento:
+                    for patron, siguiente in MARCADORES_FASE:
+                        if patron.match(cuerpo) and intento.fase != siguiente:
+                            intento.cambiar_fase(siguiente, ts)
+                            break
+            _cerrar_error()
+
+        for usuario, intento in intentos.items():
+            self._cerrar_intento(path, usuario, intento, ultimo, "SIN_RESULTADO", fases_corrida)
+            resultados["SIN_RESULTADO"] += 1
+
+        self.corridas += 1
+        self.resultados.update(resultados)
+        self._reportar_corrida(path, primero, ultimo, resultados, fases_corrida)
+
+    def _contar_selectores(self, cuerpo: str):
+        for patron in SELECTOR_HIT:
+            m = patron.match(cuerpo)
+            if m:
+                self.selectores[m.group(1)][0] += 1
+                return
+        for patron in SELECTOR_MISS:
+            m = patron.match(cuerpo)
+            if m:
+                for sel in _lista_selectores(m.group(1)):
+                    self.selectores[sel][1] += 1
+                return
+
+    def _cerrar_intento(self, path, usuario, intento: _Intento, fin, resultado, fases_corrida):
+        fases = intento.fases(fin)
+        for fase, duracion in fases:
+            self.fases[fase].agregar(duracion)
+            fases_corrida[fase].agregar(duracion)
+        if self.timelines:
+            pasos = " → ".join(f"{fase} {duracion:.1f}s" for fase, duracion in fases)
+            print(f"  {path.name} [{usuario}] {intento.inicio:%H:%M:%S} {pasos} → {resultado}", file=self.salida)
+
+    def _reportar_corrida(self, path, primero, ultimo, resultados: Counter, fases_corrida):
+        total = sum(resultados.values())
+        ok = resultados.get("OK", 0)
+        duracion = (ultimo - primero).total_seconds() if primero and ultimo else 0.0
+        tasa = f"{100 * ok / total:.0f}%" if total else "-"
+        detalle = ", ".join(f"{r}={n}" for r, n in sorted(resultados.items())) or "sin intentos"
+        medias = ", ".join(f"{f} {s.suma / s.n:.1f}s" for f, s in fases_corrida.items() if s.n)
+        print(f"{path.name}: {duracion:.0f}s, {total} intentos, éxito {tasa} ({detalle})", file=self.salida)
+        if medias:
+            print(f"    media por fase: {medias}", file=self.salida)
+
+    def reporte(self, top: int = 10):
+        out = self.salida
+        total = sum(self.resultados.values())
+        print(f"\n== {self.corridas} corridas, {total} intentos ==", file=out)
+        for resultado, n in self.resultados.most_common():
+            print(f"  {resultado:<14} {n:>6}  ({100 * n / total:.0f}%)", file=out)
+
+        print("\n== Duración por fase (s) ==", file=out)
+        print(f"  {'fase':<16}{'n':>6}{'media':>9}{'mín':>9}{'p50≤':>9}{'p95≤':>9}{'máx':>9}", file=out)
+        for fase, s in sorted(self.fases.items(), key=lambda kv: -kv[1].suma):
+            print(
+                f"  {fase:<16}{s.n:>6}{s.suma / s.n:>9.1f}{s.minimo:>9.1f}"
+                f"{s.percentil(0.5):>9.1f}{s.percentil(0.95):>9.1f}{s.maximo:>9.1f}",
+                file=out,
+            )
+
+        print("\n== Selectores con más fallos ==", file=out)
+        peores = sorted(self.selectores.items(), key=lambda kv: -kv[1][1])[:top]
+        for selector, (hit, miss) in peores:
+            if not miss:
+                break
+            print(f"  {100 * miss / (hit + miss):>5.0f}% miss ({hit} hit / {miss} miss)  {selector}", file=out)
+
+        print("\n== Excepciones más frecuentes ==", file=out)
+        for firma, n in self.excepciones.most_common(top):
+            print(f"  {n:>6}  {firma}", file=out)
+
+
+def _expandir(rutas: list[str]) -> list[Path]:
+    archivos = []
+    for ruta in rutas:
+        path = Path(ruta)
+        if path.is_dir():
+            archivos.extend(sorted(path.glob(f"{config.LOG_FILE_PREFIX}_*.log*")))
+        else:
+            archivos.append(path)
+    return archivos
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description="Analiza logs de corridas del turnero")
+    parser.add_argument("rutas", nargs="*", default=[str(config.LOG_DIR)], help="archivos .log/.log.gz o carpetas")
+    parser.add_argument("--timelines", action="store_true", help="imprimir la línea de tiempo de cada intento")
+    parser.add_argument("--top", type=int, default=10, help="cantidad de selectores/excepciones a listar")
+    args = parser.parse_args(argv)
+
+    analizador = Analizador(timelines=args.timelines)
+    for path in _expandir(args.rutas):
+        try:
+            analizador.procesar_archivo(path)
+        except OSError as err:
+            print(f"No se pudo leer {path}: {err}", file=sys.stderr)
+    analizador.reporte(top=args.top)
+
+
+if __name__ == "__main__":
+    main()
@@ -6,6 +6,7 @@ from pathlib import Path
 from playwright.sync_api import TimeoutError as PlaywrightTimeoutError
 
 import config
+import metricas
 from utils import (
     _click_first_available_any_frame,
     _force_click,
@@ -13,6 +14,8 @@ from utils import (
     _get_widget_frame,
     _log_exception,
     _safe_click,
+    _selector_hit,
+    _selector_miss,
     _wait_fill_in_frame,
     _wait_for_any_frame_selector,
     _wait_for_loading_end,
@@ -20,7 +23,8 @@ from utils import (
 )
 
 
-def _esperar_turnos_disponibles(page, usuario: str, max_intentos: int = 50) -> bool:
+def _esperar_turnos_disponibles(page, usuario: str, max_intentos: int = 50, pausas: bool = True) -> bool:
+    """Recarga la vista hasta ver turnos. Con `pausas=False` no duerme entre chequeos."""
     sin_turnos_textos = ["no hay horas disponibles", "no tienes ninguna cita"]
 
     for intento in range(max_intentos):
@@ -39,8 +43,9 @@ def _esperar_turnos_disponibles(page, usuario: str, max_intentos: int = 50) -> b
             _click_first_available_any_frame(page, config.SELECTORES["ver_historial"], usuario, timeout=8000)
             _wait_for_loading_end(page, usuario, timeout_ms=8000)
             _click_first_available_any_frame(page, config.SELECTORES["back_arrow"], usuario, timeout=8000)
-            logging.info("[%s] Esperando 60s tras ciclo Ver historial ↔︎ Flecha", usuario)
-            time.sleep(60)
+            if pausas:
+                logging.info("[%s] Esperando 60s tras ciclo Ver historial ↔︎ Flecha", usuario)
+                time.sleep(60)
 
         _wait_for_loading_end(page, usuario, timeout_ms=12000)
 
@@ -57,17 +62,22 @@ def _esperar_turnos_disponibles(page, usuario: str, max_intentos: int = 50) -> b
         try:
             html = page.content().lower()
             if any(txt in html for txt in sin_turnos_textos):
-                logging.info("[%s] Sin turnos. Esperando 30s antes de reintentar (intento %s/%s)", usuario, intento + 1, max_intentos)
-                time.sleep(30)
+                if pausas:
+                    logging.info("[%s] Sin turnos. Esperando 30s antes de reintentar (intento %s/%s)", usuario, intento + 1, max_intentos)
+                    time.sleep(30)
+                else:
+                    logging.info("[%s] Sin turnos (intento %s/%s)", usuario, intento + 1, max_intentos)
                 _click_first_available_any_frame(page, config.SELECTORES["ver_historial"], usuario, timeout=8000)
                 _wait_for_loading_end(page, usuario, timeout_ms=12000)
                 continue
         except Exception as err:  # noqa: BLE001
             _log_exception(usuario, "Error leyendo HTML para detectar sin turnos", err)
 
-        time.sleep(3)
+        if pausas:
+            time.sleep(3)
 
-    logging.warning("[%s] Máximos intentos sin ver turnos disponibles", usuario)
+    nivel = logging.WARNING if pausas else logging.DEBUG
+    logging.log(nivel, "[%s] Máximos intentos sin ver turnos disponibles", usuario)
     return False
 
 
@@ -91,9 +101,11 @@ def _buscar_botones_turno(page, usuario: str):
             botones = page.query_selector_all(selector)
             if botones:
                 logging.info("[%s] %s botones encontrados con selector %s", usuario, len(botones), selector)
+                _selector_hit(selector)
                 return botones
         except Exception as err:  # noqa: BLE001
             _log_exception(usuario, f"Error listando botones de turno con {selector}", err)
+    _selector_miss(config.SELECTORES["botones_turno"])
     logging.warning("[%s] No se encontraron botones de turno con los selectores configurados", usuario)
     return []
 
@@ -132,10 +144,44 @@ def _descargar_comprobante(page, usuario: str) -> bool:
     return False
 
 
-def intentar_sacar_turno(page, usuario: str, password: str, target_slot: int = 0) -> str:
+def sesion_activa(page) -> bool:
+    """True si el widget muestra el pie de cuenta logueada ("Ver historial")."""
+    for frame in page.frames:
+        for sel in config.SELECTORES["ver_historial"]:
+            try:
+                if frame.query_selector(sel):
+                    return True
+            except Exception:
+                continue
+    return False
+
+
+def mantener_sesion(page, usuario: str) -> bool:
+    """Ciclo Ver historial ↔ flecha para que el servidor no expire la sesión."""
+    try:
+        _click_first_available_any_frame(page, config.SELECTORES["ver_historial"], usuario, timeout=8000)
+        _wait_for_loading_end(page, usuario, timeout_ms=8000)
+        _click_first_available_any_frame(page, config.SELECTORES["back_arrow"], usuario, timeout=8000)
+        _wait_for_loading_end(page, usuario, timeout_ms=8000)
+    except Exception as err:  # noqa: BLE001
+        _log_exception(usuario, "Error manteniendo la sesión", err)
+        return False
+    return sesion_activa(page)
+
+
+class CredencialesInvalidas(Exception):
+    """El sitio rechazó usuario/contraseña: reintentar sólo acerca el bloqueo de la cuenta."""
+
+
+def iniciar_sesion(page, usuario: str, password: str):
+    """Navega hasta el widget y hace login. Devuelve la página del widget o None si falló.
+
+    Lanza `CredencialesInvalidas` si el sitio muestra el error de login.
+    """
     page.set_default_timeout(30000)
     page.set_default_navigation_timeout(60000)
 
+    metricas.entrar_fase(usuario, "navegacion")
     page.goto(config.URL_PRINCIPAL, wait_until="load", timeout=60000)
 
     _safe_click(page, config.SELECTORES["fecha_y_hora"], usuario)
@@ -147,6 +193,11 @@ def intentar_sacar_turno(page, usuario: str, password: str, target_slot: int = 0
         work_page = new_page
         work_page.wait_for_load_state("load")
         logging.info("[%s] Se abrió nueva pestaña para el widget: %s", usuario, work_page.url)
+        try:
+            # Se sigue en la pestaña del widget: la original sólo ocuparía memoria.
+            page.close()
+        except Exception as err:  # noqa: BLE001
+            logging.debug("[%s] No se pudo cerrar la pestaña original: %s", usuario, err)
     except PlaywrightTimeoutError:
         work_page.wait_for_load_state("load")
         logging.info("[%s] Sin nueva pestaña; seguimos en la actual: %s", usuario, work_page.url)
@@ -166,6 +217,7 @@ def intentar_sacar_turno(page, usuario: str, password: str, target_slot: int = 0
     page = work_page
     widget_frame = _get_widget_frame(page)
 
+    metricas.entrar_fase(usuario, "login")
     try:
         _wait_for_any_frame_selector(page, [config.SELECTORES["consultar_link"]], usuario, timeout_ms=20000)
         _click_first_available_any_frame(page, [config.SELECTORES["consultar_link"]], usuario, timeout=12000)
@@ -185,17 +237,30 @@ def intentar_sacar_turno(page, usuario: str, password: str, target_slot: int = 0
                 logging.warning("[%s] DEBUG frame %s (url %s) snippet: %s", usuario, idx, frame.url, html)
         except Exception as err:  # noqa: BLE001
             _log_exception(usuario, "No se pudo leer HTML para debug", err)
-        return "ERROR"
+        return None
 
     try:
         page.wait_for_selector(config.SELECTORES["login_error"], timeout=5000)
-        return "ERROR"
     except PlaywrightTimeoutError:
         pass
+    else:
+        logging.error("[%s] Usuario o contraseña incorrectos", usuario)
+        raise CredencialesInvalidas(usuario)
+
+    return page
+
 
-    if not _esperar_turnos_disponibles(page, usuario):
+def reservar_turno(page, usuario: str, target_slot: int = 0, max_intentos: int = 50, pausas: bool = True) -> str:
+    """Con la sesión ya iniciada, espera turnos disponibles y reserva el horario target_slot.
+
+    Con `pausas=False` y `max_intentos=1` hace un único chequeo corto y vuelve con
+    SIN_TURNOS, para poder intercalar varias cuentas en un mismo hilo (modo daemon).
+    """
+    metricas.entrar_fase(usuario, "espera_turnos")
+    if not _esperar_turnos_disponibles(page, usuario, max_intentos=max_intentos, pausas=pausas):
         return "SIN_TURNOS"
 
+    metricas.entrar_fase(usuario, "seleccion")
     servicio_visible = False
     try:
         servicio_visible = _click_first_available_any_frame(page, config.SELECTORES["servicio_card"], usuario, timeout=12000)
@@ -234,6 +299,7 @@ def intentar_sacar_turno(page, usuario: str, password: str, target_slot: int = 0
         _log_exception(usuario, "Error haciendo click en botón de horario", err)
         return "SIN_TURNOS"
 
+    metricas.entrar_fase(usuario, "confirmacion")
     _wait_for_loading_end(page, usuario, timeout_ms=15000)
     _click_first_available_any_frame(page, [config.SELECTORES["confirmar"]], usuario, timeout=12000)
     _wait_for_loading_end(page, usuario, timeout_ms=15000)
@@ -241,3 +307,13 @@ def intentar_sacar_turno(page, usuario: str, password: str, target_slot: int = 0
     _descargar_comprobante(page, usuario)
 
     return "OK"
+
+
+def intentar_sacar_turno(page, usuario: str, password: str, target_slot: int = 0) -> str:
+    try:
+        work_page = iniciar_sesion(page, usuario, password)
+    except CredencialesInvalidas:
+        return "CREDENCIALES"
+    if work_page is None:
+        return "ERROR"
+    return reservar_turno(work_page, usuario, target_slot=target_slot)
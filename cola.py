@@ -0,0 +1,98 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+
+import config
+
+
+@dataclass
+class Cuenta:
+    idx: int
+    usuario: str
+    password: str
+    intentos: int = 0
+    historial: list[str] = field(default_factory=list)
+
+    @property
+    def prioridad(self) -> float:
+        """Menor es mejor: penaliza cada intento hecho y los malos resultados previos."""
+        penalizacion = sum(config.REINTENTO_PENALIZACION.get(r, 0.0) for r in self.historial)
+        return self.intentos * config.REINTENTO_PESO_INTENTO + penalizacion
+
+
+class ColaReintentos:
+    """Cola de trabajo de `run()` con reintentos por resultado.
+
+    Las cuentas listas salen por prioridad (y en orden de llegada a igual prioridad);
+    las que están en backoff esperan aparte hasta su `listo_en`. `obtener` devuelve
+    None cuando no queda nada pendiente ni en curso.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._listas: list[tuple[float, int, Cuenta]] = []
+        self._esperando: list[tuple[float, int, Cuenta]] = []
+        self._seq = itertools.count()
+        self._en_curso = 0
+
+    def agregar(self, cuenta: Cuenta, listo_en: float = 0.0):
+        with self._cond:
+            if listo_en > time.time():
+                heapq.heappush(self._esperando, (listo_en, next(self._seq), cuenta))
+            else:
+                heapq.heappush(self._listas, (cuenta.prioridad, next(self._seq), cuenta))
+            self._cond.notify_all()
+
+    def obtener(self) -> Cuenta | None:
+        with self._cond:
+            while True:
+                ahora = time.time()
+                while self._esperando and self._esperando[0][0] <= ahora:
+                    _, _, cuenta = heapq.heappop(self._esperando)
+                    heapq.heappush(self._listas, (cuenta.prioridad, next(self._seq), cuenta))
+
+                if self._listas:
+                    _, _, cuenta = heapq.heappop(self._listas)
+                    self._en_curso += 1
+                    return cuenta
+                if not self._esperando and self._en_curso == 0:
+                    return None
+
+                espera = self._esperando[0][0] - ahora if self._esperando else None
+                self._cond.wait(timeout=espera)
+
+    def pendientes(self) -> list[Cuenta]:
+        """Cuentas que siguen en la cola (listas o en backoff), p.ej. si no quedó ningún worker."""
+        with self._cond:
+            return [cuenta for _, _, cuenta in sorted(self._listas + self._esperando, key=lambda e: e[1])]
+
+    def terminar(self, cuenta: Cuenta, resultado: str):
+        """Registra el resultado del intento y, si corresponde, vuelve a encolar la cuenta."""
+        cuenta.intentos += 1
+        cuenta.historial.append(resultado)
+
+        backoff = config.REINTENTO_BACKOFF_SEG.get(resultado)
+        if backoff is None:
+            logging.debug("[%s] Resultado %s no se reintenta", cuenta.usuario, resultado)
+        elif cuenta.intentos >= config.REINTENTO_MAX_INTENTOS:
+            logging.info(
+                "[%s] Sin más reintentos (%s intentos, último resultado %s)", cuenta.usuario, cuenta.intentos, resultado
+            )
+        else:
+            logging.info(
+                "[%s] Reencolado tras %s (intento %s/%s, espera %ss, prioridad %.1f)",
+                cuenta.usuario,
+                resultado,
+                cuenta.intentos,
+                config.REINTENTO_MAX_INTENTOS,
+                backoff,
+                cuenta.prioridad,
+            )
+            self.agregar(cuenta, listo_en=time.time() + backoff)
+
+        with self._cond:
+            self._en_curso -= 1
+            self._cond.notify_all()
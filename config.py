@@ -23,6 +23,13 @@ TURNERA_SLOTS = [
     (3, 10),
 ]
 
+# Sincronización con el reloj del servidor (header Date de las respuestas de la turnera)
+RELOJ_DOMINIOS = ["citaconsular.es", "bookitit"]
+RELOJ_TIPOS_RECURSO = ("document", "xhr", "fetch")  # estáticos suelen venir de caché
+RELOJ_MIN_MUESTRAS = 3  # por debajo de esto se usa la hora local
+RELOJ_MAX_MUESTRAS = 500
+RELOJ_MAX_OFFSET_SEG = 600  # muestras más desfasadas se descartan (headers cacheados)
+
 COL_USUARIO = "Usuario"
 COL_PASSWORD = "Contraseña"
 COL_TURNO = "Turno Conseguido"
@@ -32,8 +39,51 @@ LOG_LEVEL = "INFO"
 LOG_DIR = Path("logs")
 LOG_FILE_PREFIX = "turnero"
 
+# Endpoint local de métricas (formato Prometheus) en http://HOST:PUERTO/metrics.
+# None para desactivarlo.
+METRICAS_PUERTO = None  # p.ej. 9464
+METRICAS_HOST = "127.0.0.1"
+METRICAS_BUCKETS_FASE = (0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300, 900)
+
+# Perfilado por intento (trace de Playwright, métricas CDP y cProfile del worker).
+# PERFILADO_FRACCION: fracción de intentos muestreados con instrumentación completa.
+# PERFILADO_UMBRAL_SEG: si se define, todos los intentos llevan un trace liviano (sin
+# snapshots ni screenshots) y se guardan los que tardan más que el umbral, con las
+# métricas CDP leídas al final (cProfile sólo en los muestreados). Desde Python 3.12 el
+# cProfile abarca todo el proceso (proceso.prof) y su costo lo pagan todos los bots.
+PERFILADO_FRACCION = 0.0
+PERFILADO_UMBRAL_SEG = None  # p.ej. 120
+PERFILADO_DIR = Path("perfiles")
+
 # Concurrencia
-MAX_CONCURRENT_BOTS = 2  # ajustar según recursos/IP
+MAX_CONCURRENT_BOTS = 2  # techo; el gobernador de recursos baja la concurrencia real si falta memoria/CPU
+
+# Gobernador de recursos: muestrea RSS de Python + árbol de procesos del navegador
+GOBERNADOR_MAX_MEMORIA_MB = 3000  # RSS total a partir del cual se reduce la concurrencia
+GOBERNADOR_MAX_CPU_PCT = 90
+GOBERNADOR_INTERVALO_SEG = 2
+GOBERNADOR_ENFRIAMIENTO_SEG = 10  # tiempo mínimo entre cambios del límite
+GOBERNADOR_HOLGURA = 0.8  # se vuelve a subir el límite sólo por debajo de este % de los máximos
+GOBERNADOR_MB_POR_CONTEXTO = 350  # estimación inicial hasta medir picos reales
+GOBERNADOR_MB_POR_NAVEGADOR = 200  # ídem para un navegador recién lanzado, sin contextos
+
+# Reintentos dentro de una corrida: espera (backoff) por resultado; los resultados que
+# no figuran (p.ej. OK, o CREDENCIALES: login rechazado, que reintentado sólo acerca el
+# bloqueo por "demasiados intentos") no se reintentan. 0 = vuelve al final de la fila.
+REINTENTO_BACKOFF_SEG = {"SIN_TURNOS": 0, "ERROR": 60, "BLOQUEADO": 1800, "NAVEGADOR_CAIDO": 0}
+REINTENTO_MAX_INTENTOS = 5  # por cuenta y corrida
+# Prioridad (menor sale primero) = intentos * PESO + suma de penalizaciones del historial
+REINTENTO_PESO_INTENTO = 1.0
+REINTENTO_PENALIZACION = {"SIN_TURNOS": 0.5, "ERROR": 2.0, "BLOQUEADO": 5.0}
+
+# Supervisor del navegador de cada worker
+SUPERVISOR_MAX_REINICIOS = 3  # relanzamientos por worker antes de abandonarlo
+# Sin progreso durante un intento -> se mata el navegador. Cada llamada a Playwright que
+# vuelve (aunque sea por timeout) cuenta como progreso, así que tiene que superar el bloqueo
+# más largo sin llamadas que vuelvan: goto de 60s, o la pausa de 60s + un click de 30s.
+SUPERVISOR_WATCHDOG_SEG = 240
+SUPERVISOR_WATCHDOG_INTERVALO_SEG = 10
+
 # Máximo índice de slot preferido (0 = primer botón/horario). Se usa junto a la
 # distribución logarítmica por posición en la lista para repartir bots entre slots.
 MAX_SLOT_INDEX = 3
@@ -43,6 +93,14 @@ USER_AGENTS = [
     "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/123.0 Safari/537.36",
 ]
 
+# Modo daemon (python main.py --daemon)
+DAEMON_CHEQUEO_SEG = 10  # cada cuánto se revisa si cambió el Excel
+DAEMON_KEEPALIVE_SEG = 300  # cada cuánto se refresca cada sesión; primer reintento de un login fallido
+DAEMON_LOGIN_BACKOFF_MAX_SEG = 3600  # el reintento de login se duplica tras cada fallo hasta este tope
+DAEMON_PREPARACION_SEG = 90  # antes de la apertura se verifican todas las sesiones
+DAEMON_VENTANA_APERTURA_SEG = 120  # tras la apertura se intercalan chequeos de todas las cuentas
+DAEMON_PAUSA_RONDA_SEG = 2  # pausa entre rondas de chequeos mientras nadie consiguió turno
+
 # Selectores centralizados
 SELECTORES = {
     "fecha_y_hora": "text=Fecha y hora",
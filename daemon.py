@@ -0,0 +1,278 @@
+import logging
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+
+import pandas as pd
+from playwright.sync_api import sync_playwright
+
+import config
+import metricas
+import reloj
+from booking import CredencialesInvalidas, iniciar_sesion, mantener_sesion, reservar_turno, sesion_activa
+from recursos import GobernadorRecursos
+from runner import _cargar_excel, _crear_contexto, _guardar_turno, _setup_logging, _target_slot_for_idx
+from supervisor import NavegadorAgotado, SupervisorNavegador
+from utils import calcular_proximo_horario_turnera, esperar_hasta
+
+
+@dataclass
+class _Sesion:
+    usuario: str
+    password: str
+    idx: int
+    context: object = None
+    page: object = None
+    ultimo_keepalive: float = field(default_factory=time.time)
+    fallos_login: int = 0
+    proximo_login: float = 0.0
+    # Login rechazado: no se reintenta hasta que cambie la contraseña en el Excel (que crea
+    # una sesión nueva).
+    rechazada: bool = False
+
+    def puede_abrir(self) -> bool:
+        return not self.rechazada and time.time() >= self.proximo_login
+
+    def cerrar(self):
+        if self.context is not None:
+            try:
+                self.context.close()
+            except Exception as err:  # noqa: BLE001
+                logging.warning("[%s] No se pudo cerrar el contexto: %s", self.usuario, err)
+        self.context = None
+        self.page = None
+
+
+def _cuentas_pendientes(df: pd.DataFrame) -> dict[str, tuple[int, str]]:
+    pendientes = {}
+    for idx, row in df.iterrows():
+        usuario = str(row.get(config.COL_USUARIO, "")).strip()
+        password = str(row.get(config.COL_PASSWORD, "")).strip()
+        turno_conseguido = str(row.get(config.COL_TURNO, "")).strip()
+        if not usuario or not password or turno_conseguido.upper() == "SI":
+            continue
+        pendientes[usuario] = (idx, password)
+    return pendientes
+
+
+def _mtime_excel() -> float | None:
+    try:
+        return config.EXCEL_PATH.stat().st_mtime
+    except OSError:
+        return None
+
+
+@dataclass
+class _Excel:
+    """DataFrame de cuentas junto con el mtime del archivo del que salió (o que escribimos)."""
+    df: pd.DataFrame
+    mtime: float | None = field(default_factory=_mtime_excel)
+
+    def recargar_si_cambio(self) -> bool:
+        """Relee el Excel si cambió en disco; True si se cargó un DataFrame nuevo."""
+        mtime = _mtime_excel()
+        if mtime == self.mtime:
+            return False
+        self.mtime = mtime
+        nuevo_df = _cargar_excel()
+        if nuevo_df is None:
+            return False
+        self.df = nuevo_df
+        return True
+
+    def marcar_turno(self, usuario: str):
+        """Guarda el turno sin pisar ediciones hechas en el Excel desde la última lectura."""
+        if self.recargar_si_cambio():
+            logging.info("[DAEMON] Excel modificado durante la apertura, recargado antes de guardar")
+        for idx, row in self.df.iterrows():
+            if str(row.get(config.COL_USUARIO, "")).strip() == usuario:
+                _guardar_turno(self.df, idx)
+                self.mtime = _mtime_excel()
+                return
+        logging.warning("[%s] Turno conseguido pero la cuenta ya no está en el Excel; no se guardó", usuario)
+
+
+def _abrir_sesion(browser, sesion: _Sesion) -> bool:
+    sesion.cerrar()
+    sesion.ultimo_keepalive = time.time()
+    try:
+        sesion.context = _crear_contexto(browser)
+        page = sesion.context.new_page()
+        sesion.page = iniciar_sesion(page, sesion.usuario, sesion.password)
+    except CredencialesInvalidas:
+        logging.error("[%s] Login rechazado; no se reintenta hasta que cambie la contraseña en el Excel", sesion.usuario)
+        metricas.fin_intento(sesion.usuario, "CREDENCIALES")
+        sesion.rechazada = True
+        sesion.cerrar()
+        return False
+    except Exception as err:  # noqa: BLE001
+        logging.exception("[%s] EXCEPCIÓN iniciando sesión: %s", sesion.usuario, err)
+        sesion.page = None
+    if sesion.page is None:
+        sesion.fallos_login += 1
+        espera = min(
+            config.DAEMON_KEEPALIVE_SEG * 2 ** (sesion.fallos_login - 1), config.DAEMON_LOGIN_BACKOFF_MAX_SEG
+        )
+        sesion.proximo_login = time.time() + espera
+        logging.warning(
+            "[%s] No se pudo iniciar sesión (fallo %s); se reintenta en %ss", sesion.usuario, sesion.fallos_login, espera
+        )
+        metricas.fin_intento(sesion.usuario, "ERROR")
+        sesion.cerrar()
+        return False
+    sesion.fallos_login = 0
+    metricas.entrar_fase(sesion.usuario, "sesion_abierta")
+    logging.info("[%s] Sesión abierta y en espera de la próxima apertura", sesion.usuario)
+    return True
+
+
+def _sincronizar_sesiones(browser, sesiones: dict[str, _Sesion], pendientes: dict[str, tuple[int, str]]):
+    """Cierra las sesiones de cuentas que ya no están pendientes y abre las que faltan."""
+    for usuario in list(sesiones):
+        if usuario not in pendientes or sesiones[usuario].password != pendientes[usuario][1]:
+            logging.info("[%s] Cuenta quitada/modificada en el Excel, cerrando sesión", usuario)
+            sesiones.pop(usuario).cerrar()
+
+    for usuario, (idx, password) in pendientes.items():
+        sesion = sesiones.get(usuario)
+        if sesion is None:
+            sesion = sesiones[usuario] = _Sesion(usuario, password, idx)
+        sesion.idx = idx
+        if sesion.page is None and sesion.puede_abrir():
+            _abrir_sesion(browser, sesion)
+
+
+def _mantener_sesiones(browser, sesiones: dict[str, _Sesion], forzar: bool = False):
+    ahora = time.time()
+    for sesion in sesiones.values():
+        if sesion.page is None:
+            # Las sesiones sin abrir siguen su propio backoff de login, también con `forzar`.
+            if sesion.puede_abrir():
+                _abrir_sesion(browser, sesion)
+            continue
+        if not forzar and ahora - sesion.ultimo_keepalive < config.DAEMON_KEEPALIVE_SEG:
+            continue
+        sesion.ultimo_keepalive = ahora
+        if not mantener_sesion(sesion.page, sesion.usuario):
+            logging.info("[%s] Sesión expirada, volviendo a loguear", sesion.usuario)
+            _abrir_sesion(browser, sesion)
+
+
+def _navegador(supervisor: SupervisorNavegador, sesiones: dict[str, _Sesion]):
+    """Devuelve el navegador, relanzándolo si se cayó; sus sesiones quedan para reabrir."""
+    if supervisor.conectado():
+        return supervisor.browser
+    if supervisor.browser is not None:
+        logging.error("[DAEMON] El navegador se cayó; relanzando y reabriendo sesiones")
+        for sesion in sesiones.values():
+            sesion.context = None
+            sesion.page = None
+    return supervisor.navegador()
+
+
+def _cerrar_intento(excel: _Excel, sesiones: dict[str, _Sesion], sesion: _Sesion, resultado: str):
+    metricas.fin_intento(sesion.usuario, resultado)
+    logging.info("[%s] Resultado: %s", sesion.usuario, resultado)
+
+    if resultado == "OK":
+        excel.marcar_turno(sesion.usuario)
+        sesiones.pop(sesion.usuario).cerrar()
+    elif resultado != "SIN_TURNOS" or not sesion_activa(sesion.page):
+        # Tras un error o bloqueo no se confía en el estado de la página.
+        sesion.cerrar()
+    else:
+        metricas.entrar_fase(sesion.usuario, "sesion_abierta")
+
+
+def _intentar_apertura(excel: _Excel, sesiones: dict[str, _Sesion], apertura: datetime):
+    """Intercala chequeos cortos de todas las cuentas hasta que se cierra la ventana de apertura.
+
+    Con un solo navegador y la API sync las cuentas no pueden esperar en paralelo; en vez de
+    agotar los reintentos de una antes de pasar a la siguiente, cada ronda hace un único
+    chequeo sin pausas por cuenta. Así la cuenta N empieza unos segundos (N chequeos) después
+    de la apertura, no minutos.
+    """
+    fin = apertura + timedelta(seconds=config.DAEMON_VENTANA_APERTURA_SEG)
+    en_juego = [usuario for usuario, sesion in sesiones.items() if sesion.page is not None]
+    logging.info("[DAEMON] Apertura: intercalando %s cuentas hasta %s", len(en_juego), fin.strftime("%H:%M:%S"))
+
+    while en_juego and reloj.ahora_servidor() < fin:
+        for usuario in list(en_juego):
+            sesion = sesiones[usuario]
+            try:
+                resultado = reservar_turno(
+                    sesion.page,
+                    usuario,
+                    target_slot=_target_slot_for_idx(sesion.idx),
+                    max_intentos=1,
+                    pausas=False,
+                )
+            except Exception as err:  # noqa: BLE001
+                logging.exception("[%s] EXCEPCIÓN no controlada: %s", usuario, err)
+                resultado = "ERROR"
+            if resultado == "SIN_TURNOS" and sesion_activa(sesion.page):
+                continue
+            en_juego.remove(usuario)
+            _cerrar_intento(excel, sesiones, sesion, resultado)
+        if en_juego:
+            time.sleep(config.DAEMON_PAUSA_RONDA_SEG)
+
+    for usuario in en_juego:
+        _cerrar_intento(excel, sesiones, sesiones[usuario], "SIN_TURNOS")
+
+
+def run_daemon():
+    """Modo daemon: un navegador persistente con una sesión logueada por cuenta pendiente.
+
+    En cada apertura de TURNERA_SLOTS sólo se reintentan las cuentas sin turno, y el
+    Excel se vuelve a leer cuando cambia en disco.
+    """
+    _setup_logging()
+
+    df = _cargar_excel()
+    if df is None:
+        return
+    # Un solo navegador: el gobernador no admite nada, sólo mide memoria para /metrics.
+    gobernador = GobernadorRecursos(1)
+    gobernador.iniciar()
+    metricas.iniciar_servidor(gobernador)
+    excel = _Excel(df)
+    sesiones: dict[str, _Sesion] = {}
+
+    with sync_playwright() as p:
+        supervisor = SupervisorNavegador(p, "DAEMON", gobernador)
+        try:
+            while True:
+                browser = _navegador(supervisor, sesiones)
+                if excel.recargar_si_cambio():
+                    logging.info("[DAEMON] Excel modificado, recargando cuentas")
+                _sincronizar_sesiones(browser, sesiones, _cuentas_pendientes(excel.df))
+                apertura = calcular_proximo_horario_turnera()
+                logging.info("[DAEMON] %s cuentas pendientes; próxima apertura %s", len(sesiones), apertura)
+
+                while (apertura - reloj.ahora_servidor()).total_seconds() > config.DAEMON_PREPARACION_SEG:
+                    time.sleep(config.DAEMON_CHEQUEO_SEG)
+                    browser = _navegador(supervisor, sesiones)
+                    if excel.recargar_si_cambio():
+                        logging.info("[DAEMON] Excel modificado, recargando cuentas")
+                        _sincronizar_sesiones(browser, sesiones, _cuentas_pendientes(excel.df))
+                    _mantener_sesiones(browser, sesiones)
+
+                browser = _navegador(supervisor, sesiones)
+                _mantener_sesiones(browser, sesiones, forzar=True)
+                esperar_hasta(apertura)
+                _intentar_apertura(excel, sesiones, apertura)
+                if supervisor.conectado():
+                    # Los reinicios limitan caídas seguidas, no las de días de daemon.
+                    supervisor.reinicios = 0
+        except NavegadorAgotado as err:
+            logging.error("[DAEMON] Se agotaron los reinicios del navegador: %s", err)
+        except KeyboardInterrupt:
+            logging.info("[DAEMON] Interrumpido, cerrando sesiones")
+        finally:
+            for sesion in sesiones.values():
+                sesion.cerrar()
+            supervisor.cerrar()
+            gobernador.detener()
+            metricas.detener_servidor()
+            reloj.log_estado()
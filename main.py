@@ -1,5 +1,20 @@
+import argparse
+
 from runner import run
 
 
 if __name__ == "__main__":
-    run()
+    parser = argparse.ArgumentParser(description="Turnero")
+    parser.add_argument(
+        "--daemon",
+        action="store_true",
+        help="mantener el navegador y las sesiones abiertas entre aperturas de la turnera",
+    )
+    args = parser.parse_args()
+
+    if args.daemon:
+        from daemon import run_daemon
+
+        run_daemon()
+    else:
+        run()
@@ -0,0 +1,168 @@
+import logging
+import threading
+import time
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import config
+
+RESULTADOS = ("OK", "SIN_TURNOS", "BLOQUEADO", "ERROR", "CREDENCIALES")
+# Fases en las que la cuenta no está intentando nada (sesión logueada esperando la apertura).
+FASES_EN_ESPERA = ("sesion_abierta",)
+
+_lock = threading.Lock()
+_fase_actual: dict[str, tuple[str, float]] = {}
+_intentos: dict[str, int] = {r: 0 for r in RESULTADOS}
+_selectores: dict[tuple[str, str], int] = defaultdict(int)
+_hist_buckets: dict[str, list[int]] = {}
+_hist_suma: dict[str, float] = defaultdict(float)
+_hist_cuenta: dict[str, int] = defaultdict(int)
+
+_gobernador = None
+_servidor: ThreadingHTTPServer | None = None
+
+
+def entrar_fase(usuario: str, fase: str):
+    """Cierra la fase en curso de la cuenta (registrando su duración) y abre `fase`.
+
+    Volver a entrar a la fase en curso no hace nada: la fase sigue abierta.
+    """
+    ahora = time.time()
+    with _lock:
+        previa = _fase_actual.get(usuario)
+        if previa and previa[0] == fase:
+            return
+        _fase_actual[usuario] = (fase, ahora)
+    if previa:
+        _cerrar_fase(usuario, previa[0], ahora - previa[1])
+
+
+def fin_intento(usuario: str, resultado: str):
+    """Cierra la última fase de la cuenta y cuenta el intento según su resultado."""
+    with _lock:
+        previa = _fase_actual.pop(usuario, None)
+        _intentos[resultado] = _intentos.get(resultado, 0) + 1
+    if previa:
+        _cerrar_fase(usuario, previa[0], time.time() - previa[1])
+
+
+def selector_hit(selector: str):
+    with _lock:
+        _selectores[(selector, "hit")] += 1
+
+
+def selector_miss(selectores):
+    sels = selectores if isinstance(selectores, list) else [selectores]
+    with _lock:
+        for sel in sels:
+            _selectores[(sel, "miss")] += 1
+
+
+def _cerrar_fase(usuario: str, fase: str, duracion: float):
+    logging.info("[%s] Fase %s: %.2fs", usuario, fase, duracion)
+    buckets = config.METRICAS_BUCKETS_FASE
+    with _lock:
+        conteos = _hist_buckets.setdefault(fase, [0] * len(buckets))
+        for i, limite in enumerate(buckets):
+            if duracion <= limite:
+                conteos[i] += 1
+        _hist_suma[fase] += duracion
+        _hist_cuenta[fase] += 1
+
+
+def _escapar(valor: str) -> str:
+    return str(valor).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def render() -> str:
+    """Devuelve todas las métricas en formato de texto de Prometheus."""
+    lineas = []
+
+    def _metrica(nombre: str, tipo: str, ayuda: str):
+        lineas.append(f"# HELP {nombre} {ayuda}")
+        lineas.append(f"# TYPE {nombre} {tipo}")
+
+    with _lock:
+        fases = dict(_fase_actual)
+        intentos = dict(_intentos)
+        selectores = dict(_selectores)
+        hist = {f: (list(c), _hist_suma[f], _hist_cuenta[f]) for f, c in _hist_buckets.items()}
+
+    en_espera = sum(1 for fase, _ in fases.values() if fase in FASES_EN_ESPERA)
+    _metrica("turnero_bots_activos", "gauge", "Cuentas con un intento en curso.")
+    lineas.append(f"turnero_bots_activos {len(fases) - en_espera}")
+    _metrica("turnero_sesiones_en_espera", "gauge", "Cuentas con sesión abierta esperando la apertura (daemon).")
+    lineas.append(f"turnero_sesiones_en_espera {en_espera}")
+
+    _metrica("turnero_fase_cuenta", "gauge", "Fase en la que está cada cuenta (1 = fase actual).")
+    for usuario, (fase, _) in sorted(fases.items()):
+        lineas.append(f'turnero_fase_cuenta{{usuario="{_escapar(usuario)}",fase="{_escapar(fase)}"}} 1')
+
+    _metrica("turnero_intentos_total", "counter", "Intentos terminados por resultado.")
+    for resultado, n in sorted(intentos.items()):
+        lineas.append(f'turnero_intentos_total{{resultado="{_escapar(resultado)}"}} {n}')
+
+    _metrica("turnero_fase_duracion_segundos", "histogram", "Duración de cada fase del intento.")
+    buckets = config.METRICAS_BUCKETS_FASE
+    for fase, (conteos, suma, cuenta) in sorted(hist.items()):
+        f = _escapar(fase)
+        for limite, n in zip(buckets, conteos):
+            lineas.append(f'turnero_fase_duracion_segundos_bucket{{fase="{f}",le="{limite}"}} {n}')
+        lineas.append(f'turnero_fase_duracion_segundos_bucket{{fase="{f}",le="+Inf"}} {cuenta}')
+        lineas.append(f'turnero_fase_duracion_segundos_sum{{fase="{f}"}} {suma:.6f}')
+        lineas.append(f'turnero_fase_duracion_segundos_count{{fase="{f}"}} {cuenta}')
+
+    _metrica("turnero_selector_total", "counter", "Búsquedas de selectores por resultado (hit/miss).")
+    for (selector, resultado), n in sorted(selectores.items()):
+        lineas.append(f'turnero_selector_total{{selector="{_escapar(selector)}",resultado="{resultado}"}} {n}')
+
+    if _gobernador is not None:
+        _metrica("turnero_memoria_mb", "gauge", "RSS medido por el gobernador de recursos.")
+        lineas.append(f'turnero_memoria_mb{{proceso="python"}} {_gobernador.rss_python_mb:.1f}')
+        lineas.append(f'turnero_memoria_mb{{proceso="navegador"}} {_gobernador.rss_navegador_mb:.1f}')
+        _metrica("turnero_cpu_pct", "gauge", "Uso de CPU del host.")
+        lineas.append(f"turnero_cpu_pct {_gobernador.cpu_pct:.1f}")
+        _metrica("turnero_limite_concurrencia", "gauge", "Límite de concurrencia fijado por el gobernador.")
+        lineas.append(f"turnero_limite_concurrencia {_gobernador.limite}")
+
+    return "\n".join(lineas) + "\n"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):  # noqa: N802
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        cuerpo = render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def log_message(self, format, *args):  # noqa: A002
+        logging.debug("[METRICAS] " + format, *args)
+
+
+def iniciar_servidor(gobernador=None):
+    """Levanta el endpoint /metrics en un hilo si METRICAS_PUERTO está configurado."""
+    global _gobernador, _servidor
+    _gobernador = gobernador
+    if not config.METRICAS_PUERTO:
+        return
+    try:
+        _servidor = ThreadingHTTPServer((config.METRICAS_HOST, config.METRICAS_PUERTO), _Handler)
+    except OSError as err:
+        logging.warning("No se pudo iniciar el endpoint de métricas: %s", err)
+        return
+    _servidor.daemon_threads = True
+    threading.Thread(target=_servidor.serve_forever, name="metricas", daemon=True).start()
+    logging.info("Métricas en http://%s:%s/metrics", config.METRICAS_HOST, config.METRICAS_PUERTO)
+
+
+def detener_servidor():
+    global _servidor
+    if _servidor is not None:
+        _servidor.shutdown()
+        _servidor.server_close()
+        _servidor = None
@@ -0,0 +1,153 @@
+import cProfile
+import io
+import json
+import logging
+import pstats
+import random
+import re
+import sys
+import threading
+from datetime import datetime
+from pathlib import Path
+
+import config
+
+# cProfile no admite dos perfiles activos a la vez (desde 3.12 usa sys.monitoring, que es
+# global): sólo un intento muestreado por vez lleva cProfile.
+_lock_cprofile = threading.Lock()
+# Por lo mismo, desde 3.12 el perfil incluye todos los hilos (otros workers, gobernador,
+# watchdog, servidor de métricas) y no sólo el del intento: se guarda como "proceso".
+_CPROFILE_PROCESO = sys.version_info >= (3, 12)
+_NOMBRE_CPROFILE = "proceso" if _CPROFILE_PROCESO else "worker"
+_corrida = datetime.now().strftime("%Y%m%d_%H%M%S")
+
+
+def iniciar_corrida(nombre: str):
+    """Fija la subcarpeta de PERFILADO_DIR para los artefactos de esta corrida."""
+    global _corrida
+    _corrida = nombre
+
+
+class PerfiladoIntento:
+    """Instrumentación opcional y muestreada de un intento (un contexto de Playwright).
+
+    - Muestreado (PERFILADO_FRACCION): trace con screenshots y snapshots del DOM, métricas
+      CDP y cProfile.
+    - Por umbral (PERFILADO_UMBRAL_SEG): trace liviano (acciones y red, sin snapshots) en
+      todos los intentos; las métricas CDP se leen al final y sólo si superó el umbral.
+    Sin ninguna de las dos opciones no hace nada.
+    """
+
+    def __init__(self, context, usuario: str, intento: int):
+        self.usuario = usuario
+        self.intento = intento
+        self.muestreado = random.random() < config.PERFILADO_FRACCION
+        self.por_umbral = config.PERFILADO_UMBRAL_SEG is not None
+        self.activo = self.muestreado or self.por_umbral
+
+        self._context = context
+        self._cdp: list[tuple[str, object]] = []
+        self._profile: cProfile.Profile | None = None
+        self._tracing = False
+
+        if not self.activo:
+            return
+        try:
+            context.tracing.start(
+                name=f"{usuario}_{intento}",
+                screenshots=self.muestreado,
+                snapshots=self.muestreado,
+                sources=self.muestreado,
+            )
+            self._tracing = True
+        except Exception as err:  # noqa: BLE001
+            logging.warning("[%s] No se pudo iniciar el trace: %s", usuario, err)
+        if not self.muestreado:
+            return
+        context.on("page", self._conectar_cdp)
+        if _lock_cprofile.acquire(blocking=False):
+            self._profile = cProfile.Profile()
+            try:
+                self._profile.enable()
+            except ValueError as err:
+                logging.debug("[%s] cProfile no disponible: %s", usuario, err)
+                self._profile = None
+                _lock_cprofile.release()
+
+    def _conectar_cdp(self, page):
+        try:
+            sesion = self._context.new_cdp_session(page)
+            sesion.send("Performance.enable")
+            self._cdp.append((page.url, sesion))
+        except Exception as err:  # noqa: BLE001
+            logging.debug("[%s] Sin métricas CDP para %s: %s", self.usuario, page.url, err)
+
+    def _metricas_cdp(self) -> list[dict]:
+        resultado = []
+        for url_inicial, sesion in self._cdp:
+            try:
+                metricas = sesion.send("Performance.getMetrics").get("metrics", [])
+            except Exception:  # noqa: BLE001
+                continue
+            resultado.append({"url": url_inicial, "metrics": {m["name"]: m["value"] for m in metricas}})
+        return resultado
+
+    def finalizar(self, duracion: float, resultado: str):
+        """Detiene la instrumentación y guarda los artefactos si corresponde. Nunca lanza."""
+        if not self.activo:
+            return
+
+        if self._profile is not None:
+            self._profile.disable()
+            _lock_cprofile.release()
+
+        lento = self.por_umbral and duracion > config.PERFILADO_UMBRAL_SEG
+        if not (self.muestreado or lento):
+            self._detener_trace(None)
+            return
+
+        if not self.muestreado:
+            # Por umbral: CDP recién ahora, sobre las páginas que siguen abiertas.
+            try:
+                paginas = list(self._context.pages)
+            except Exception:  # noqa: BLE001
+                paginas = []
+            for page in paginas:
+                self._conectar_cdp(page)
+
+        nombre = re.sub(r"[^\w.-]", "_", f"{self.usuario}_intento{self.intento}")
+        destino = Path(config.PERFILADO_DIR) / _corrida / nombre
+        try:
+            destino.mkdir(parents=True, exist_ok=True)
+            (destino / "cdp_metrics.json").write_text(
+                json.dumps(
+                    {"duracion_seg": duracion, "resultado": resultado, "paginas": self._metricas_cdp()},
+                    indent=2,
+                ),
+                encoding="utf-8",
+            )
+            if self._profile is not None:
+                self._profile.dump_stats(str(destino / f"{_NOMBRE_CPROFILE}.prof"))
+                texto = io.StringIO()
+                if _CPROFILE_PROCESO:
+                    texto.write("cProfile de todo el proceso (Python >= 3.12): incluye todos los hilos.\n")
+                pstats.Stats(self._profile, stream=texto).sort_stats("cumulative").print_stats(40)
+                (destino / f"{_NOMBRE_CPROFILE}.txt").write_text(texto.getvalue(), encoding="utf-8")
+        except Exception as err:  # noqa: BLE001
+            logging.warning("[%s] No se pudieron guardar artefactos de perfilado: %s", self.usuario, err)
+        self._detener_trace(destino / "trace.zip")
+
+        motivo = "muestreo" if self.muestreado else f"latencia {duracion:.1f}s > {config.PERFILADO_UMBRAL_SEG}s"
+        logging.info("[%s] Perfilado guardado en %s (%s)", self.usuario, destino, motivo)
+
+    def _detener_trace(self, path: Path | None):
+        if not self._tracing:
+            return
+        try:
+            if path is None:
+                self._context.tracing.stop()
+            else:
+                self._context.tracing.stop(path=str(path))
+        except Exception as err:  # noqa: BLE001
+            logging.debug("[%s] No se pudo detener el trace: %s", self.usuario, err)
+        self._tracing = False
@@ -0,0 +1,255 @@
+import logging
+import threading
+import time
+
+import psutil
+
+import config
+
+MB = 1024 * 1024
+
+
+class GobernadorRecursos:
+    """Limita cuántas cuentas corren a la vez según la memoria y CPU del host.
+
+    Un hilo muestrea periódicamente el RSS del proceso Python y de todo su árbol de
+    procesos hijos (driver de Playwright + Chromium). Con esas muestras se sube o baja
+    el límite de concurrencia entre 1 y `max_bots`, y `admitir` sólo deja pasar una
+    cuenta nueva cuando hay lugar y margen de memoria para otro contexto (y para lanzar
+    el navegador del worker, si no lo tiene abierto).
+
+    Cada worker registra los procesos de su navegador: como un navegador atiende una
+    cuenta por vez, la memoria del contexto es el RSS de ese navegador menos lo que
+    ocupa en reposo.
+    """
+
+    def __init__(self, max_bots: int):
+        self.max_bots = max(1, max_bots)
+        self.limite = self.max_bots
+        self.rss_python_mb = 0.0
+        self.rss_navegador_mb = 0.0
+        self.cpu_pct = 0.0
+        self.pico_total_mb = 0.0
+        self.mb_por_contexto = float(config.GOBERNADOR_MB_POR_CONTEXTO)
+        self.mb_por_navegador = float(config.GOBERNADOR_MB_POR_NAVEGADOR)
+
+        self._activos: dict[str, float] = {}
+        self._worker_de: dict[str, str] = {}
+        self._lanzan_navegador: set[str] = set()
+        self._navegadores: dict[str, set[int]] = {}
+        self._base_navegador: dict[str, float] = {}
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._hilo: threading.Thread | None = None
+        self._proceso = psutil.Process()
+        self._ultimo_ajuste = 0.0
+
+    @property
+    def activos(self) -> int:
+        with self._cond:
+            return len(self._activos)
+
+    @property
+    def rss_total_mb(self) -> float:
+        return self.rss_python_mb + self.rss_navegador_mb
+
+    def iniciar(self):
+        self._muestrear_una_vez()
+        self._hilo = threading.Thread(target=self._loop_muestreo, name="gobernador", daemon=True)
+        self._hilo.start()
+        logging.info(
+            "[GOBERNADOR] Iniciado: máx %s bots, límite memoria %s MB, límite CPU %s%%",
+            self.max_bots,
+            config.GOBERNADOR_MAX_MEMORIA_MB,
+            config.GOBERNADOR_MAX_CPU_PCT,
+        )
+
+    def detener(self):
+        self._stop.set()
+        if self._hilo:
+            self._hilo.join(timeout=5)
+        logging.info(
+            "[GOBERNADOR] Pico de memoria total: %.0f MB; estimación por contexto: %.0f MB; límite final: %s",
+            self.pico_total_mb,
+            self.mb_por_contexto,
+            self.limite,
+        )
+
+    def registrar_navegador(self, worker: str, pids: set[int]):
+        base = self._medir_arbol(pids)
+        with self._cond:
+            self._navegadores[worker] = set(pids)
+            self._base_navegador[worker] = base
+            if base:
+                self.mb_por_navegador = 0.7 * self.mb_por_navegador + 0.3 * base
+        logging.info("[GOBERNADOR] Navegador de %s registrado (%.0f MB en reposo)", worker, base)
+
+    def quitar_navegador(self, worker: str):
+        with self._cond:
+            self._navegadores.pop(worker, None)
+            self._base_navegador.pop(worker, None)
+            self._cond.notify_all()
+
+    def sobran_navegadores(self) -> bool:
+        """True si hay más navegadores abiertos que el límite actual de concurrencia."""
+        with self._cond:
+            return len(self._navegadores) > self.limite
+
+    def admitir(self, usuario: str, worker: str, necesita_navegador: bool = False, al_esperar=None):
+        """Bloquea hasta que haya lugar para un contexto más.
+
+        Si hay que esperar y el worker tiene un navegador ocioso, se llama `al_esperar`
+        (fuera del lock) para que lo cierre y libere su memoria mientras tanto.
+        """
+        inicio = time.time()
+        with self._cond:
+            hay_lugar = self._hay_lugar(necesita_navegador)
+        if not hay_lugar and not necesita_navegador and al_esperar is not None:
+            logging.info("[GOBERNADOR] %s espera lugar; cierra su navegador ocioso", worker)
+            al_esperar()
+            necesita_navegador = True
+        with self._cond:
+            while not self._hay_lugar(necesita_navegador):
+                self._cond.wait(timeout=config.GOBERNADOR_INTERVALO_SEG)
+            self._activos[usuario] = 0.0
+            self._worker_de[usuario] = worker
+            if necesita_navegador:
+                self._lanzan_navegador.add(usuario)
+            espera = time.time() - inicio
+            logging.info(
+                "[%s] Admitido por gobernador tras %.1fs (activos %s/%s, memoria %.0f MB + %.0f MB reservados, CPU %.0f%%)",
+                usuario,
+                espera,
+                len(self._activos),
+                self.limite,
+                self.rss_total_mb,
+                self._reserva_mb(),
+                self.cpu_pct,
+            )
+
+    def liberar(self, usuario: str):
+        with self._cond:
+            pico = self._activos.pop(usuario, 0.0)
+            self._worker_de.pop(usuario, None)
+            self._lanzan_navegador.discard(usuario)
+            if pico:
+                # Media móvil: la estimación sigue a los picos reales del sitio.
+                self.mb_por_contexto = 0.7 * self.mb_por_contexto + 0.3 * pico
+            self._cond.notify_all()
+        logging.info("[%s] Pico de memoria por contexto ≈ %.0f MB", usuario, pico)
+
+    def _hay_lugar(self, necesita_navegador: bool) -> bool:
+        if not self._activos:
+            return True
+        if len(self._activos) >= self.limite:
+            return False
+        costo = self.mb_por_contexto + (self.mb_por_navegador if necesita_navegador else 0.0)
+        return self.rss_total_mb + self._reserva_mb() + costo <= config.GOBERNADOR_MAX_MEMORIA_MB
+
+    def _reserva_mb(self) -> float:
+        """Memoria estimada de las cuentas admitidas que todavía no se midieron.
+
+        La muestra de RSS se refresca cada GOBERNADOR_INTERVALO_SEG: sin esta reserva, varias
+        cuentas admitidas a la vez (p.ej. en la apertura) pasarían contra la misma lectura.
+        """
+        reserva = 0.0
+        for usuario, pico in self._activos.items():
+            if pico == 0.0:
+                reserva += self.mb_por_contexto
+                if usuario in self._lanzan_navegador:
+                    reserva += self.mb_por_navegador
+        return reserva
+
+    @staticmethod
+    def _medir_arbol(pids: set[int]) -> float:
+        total = 0
+        for pid in pids:
+            try:
+                raiz = psutil.Process(pid)
+                procesos = [raiz] + raiz.children(recursive=True)
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                continue
+            for proc in procesos:
+                try:
+                    total += proc.memory_info().rss
+                except (psutil.NoSuchProcess, psutil.AccessDenied):
+                    continue
+        return total / MB
+
+    def _medir(self) -> tuple[float, float]:
+        rss_python = self._proceso.memory_info().rss
+        rss_navegador = 0
+        for hijo in self._proceso.children(recursive=True):
+            try:
+                rss_navegador += hijo.memory_info().rss
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                continue
+        return rss_python / MB, rss_navegador / MB
+
+    def _muestrear_una_vez(self):
+        try:
+            rss_python, rss_navegador = self._medir()
+        except Exception as err:  # noqa: BLE001
+            logging.warning("[GOBERNADOR] No se pudo medir memoria: %s", err)
+            return
+        cpu = psutil.cpu_percent(interval=None)
+
+        with self._cond:
+            navegadores = dict(self._navegadores)
+            en_uso = set(self._worker_de.values())
+        rss_por_worker = {worker: self._medir_arbol(pids) for worker, pids in navegadores.items()}
+
+        with self._cond:
+            self.rss_python_mb = rss_python
+            self.rss_navegador_mb = rss_navegador
+            self.cpu_pct = cpu
+            self.pico_total_mb = max(self.pico_total_mb, self.rss_total_mb)
+            for worker, rss in rss_por_worker.items():
+                if worker not in en_uso and worker in self._base_navegador:
+                    # Navegador ocioso: su RSS actual es la base a descontar.
+                    self._base_navegador[worker] = rss
+            for usuario, pico in self._activos.items():
+                worker = self._worker_de.get(usuario)
+                if worker in rss_por_worker:
+                    por_contexto = rss_por_worker[worker] - self._base_navegador.get(worker, 0.0)
+                    self._activos[usuario] = max(pico, por_contexto)
+            self._ajustar_limite()
+            self._cond.notify_all()
+
+    def _ajustar_limite(self):
+        ahora = time.time()
+        if ahora - self._ultimo_ajuste < config.GOBERNADOR_ENFRIAMIENTO_SEG:
+            return
+
+        total = self.rss_total_mb
+        max_mem = config.GOBERNADOR_MAX_MEMORIA_MB
+        max_cpu = config.GOBERNADOR_MAX_CPU_PCT
+        holgura = config.GOBERNADOR_HOLGURA
+
+        anterior = self.limite
+        if (total > max_mem or self.cpu_pct > max_cpu) and self.limite > 1:
+            self.limite -= 1
+        elif (
+            self.limite < self.max_bots
+            and total + self.mb_por_contexto <= max_mem * holgura
+            and self.cpu_pct <= max_cpu * holgura
+        ):
+            self.limite += 1
+
+        if self.limite != anterior:
+            self._ultimo_ajuste = ahora
+            logging.info(
+                "[GOBERNADOR] Límite de concurrencia %s -> %s (memoria %.0f/%s MB [python %.0f, navegador %.0f], CPU %.0f%%/%s%%)",
+                anterior,
+                self.limite,
+                total,
+                max_mem,
+                self.rss_python_mb,
+                self.rss_navegador_mb,
+                self.cpu_pct,
+                max_cpu,
+            )
+
+    def _loop_muestreo(self):
+        while not self._stop.wait(config.GOBERNADOR_INTERVALO_SEG):
+            self._muestrear_una_vez()
@@ -0,0 +1,138 @@
+import logging
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+
+import config
+
+_lock = threading.Lock()
+# Cada muestra es el intervalo (min, max) en el que tiene que estar el offset
+# servidor - local, más el RTT con el que se obtuvo.
+_muestras: deque[tuple[float, float, float]] = deque(maxlen=config.RELOJ_MAX_MUESTRAS)
+_ultimo_offset = 0.0
+
+
+def registrar_muestra(fecha_header: str, t_envio: float, t_recepcion: float) -> bool:
+    """Agrega una muestra a partir del header `Date` y los instantes locales de envío/recepción.
+
+    El servidor generó `Date` (truncado al segundo) en algún momento entre el envío y la
+    recepción, así que el offset queda acotado a [D - t_recepcion, D + 1 - t_envio].
+    """
+    try:
+        servidor = parsedate_to_datetime(fecha_header).timestamp()
+    except (TypeError, ValueError):
+        return False
+    if t_recepcion < t_envio:
+        return False
+
+    lo = servidor - t_recepcion
+    hi = servidor + 1 - t_envio
+    if abs((lo + hi) / 2) > config.RELOJ_MAX_OFFSET_SEG:
+        # Header cacheado por algún intermediario o fecha basura: no sirve para sincronizar.
+        return False
+    with _lock:
+        _muestras.append((lo, hi, t_recepcion - t_envio))
+    return True
+
+
+def registrar_respuesta(response):
+    """Handler de `context.on("response")`: toma el `Date` de las respuestas de la turnera.
+
+    Sólo sirven respuestas que realmente fueron a la red: las servidas desde la caché del
+    navegador, un service worker o un proxy traen el `Date` de cuando se guardaron.
+    """
+    try:
+        if not any(dominio in response.url for dominio in config.RELOJ_DOMINIOS):
+            return
+        if response.request.resource_type not in config.RELOJ_TIPOS_RECURSO:
+            return
+        if response.status == 304 or response.from_service_worker:
+            return
+        if response.headers.get("age"):
+            return
+        fecha = response.headers.get("date")
+        if not fecha:
+            return
+        timing = response.request.timing
+        inicio = timing.get("startTime", -1)
+        envio = timing.get("requestStart", -1)
+        respuesta = timing.get("responseStart", -1)
+        if inicio <= 0 or envio < 0 or respuesta < 0:
+            # Sin tiempos de red: la respuesta salió de la caché.
+            return
+        t_envio = (inicio + envio) / 1000
+        t_recepcion = (inicio + respuesta) / 1000
+        registrar_muestra(fecha, t_envio, t_recepcion)
+    except Exception as err:  # noqa: BLE001
+        logging.debug("No se pudo registrar muestra de reloj: %s", err)
+
+
+def estimar() -> tuple[float, float, int]:
+    """Devuelve (offset, incertidumbre, muestras usadas), en segundos.
+
+    Toma el tramo de offsets compatible con la mayor cantidad de muestras (algoritmo de
+    Marzullo): una muestra suelta inconsistente (p.ej. otro backend detrás del balanceador)
+    queda afuera sin descartar el resto. Las muestras con RTT alto dan intervalos anchos que
+    coinciden con casi todo, así que el tramo lo acotan las de RTT bajo.
+    """
+    with _lock:
+        muestras = list(_muestras)
+    if not muestras:
+        return 0.0, float("inf"), 0
+
+    # A igual valor, los inicios van antes que los fines: intervalos que se tocan coinciden.
+    eventos = sorted([(m_lo, 0) for m_lo, _, _ in muestras] + [(m_hi, 1) for _, m_hi, _ in muestras])
+    abiertas = usadas = 0
+    lo = hi = 0.0
+    for i, (valor, es_fin) in enumerate(eventos):
+        if es_fin:
+            abiertas -= 1
+            continue
+        abiertas += 1
+        if abiertas > usadas:
+            # El tramo va hasta el próximo evento, que siempre es un fin.
+            usadas, lo, hi = abiertas, valor, eventos[i + 1][0]
+    return (lo + hi) / 2, (hi - lo) / 2, usadas
+
+
+def offset() -> float:
+    """Offset servidor - local a aplicar.
+
+    Mientras no haya muestras suficientes se mantiene la última estimación válida (0 si
+    nunca la hubo), para que la hora objetivo no salte entre chequeos de `esperar_hasta`.
+    """
+    global _ultimo_offset
+    valor, _, usadas = estimar()
+    if usadas < config.RELOJ_MIN_MUESTRAS:
+        return _ultimo_offset
+    _ultimo_offset = valor
+    return valor
+
+
+def ahora_servidor() -> datetime:
+    """`datetime.now()` corregido a la hora estimada del servidor de la turnera."""
+    return datetime.fromtimestamp(time.time() + offset())
+
+
+def log_estado():
+    valor, incertidumbre, usadas = estimar()
+    with _lock:
+        total = len(_muestras)
+        rtt_min = min((m[2] for m in _muestras), default=0.0)
+    if usadas < config.RELOJ_MIN_MUESTRAS:
+        logging.info(
+            "[RELOJ] Sin muestras suficientes para estimar el offset (%s/%s); se usa la hora local",
+            usadas,
+            config.RELOJ_MIN_MUESTRAS,
+        )
+        return
+    logging.info(
+        "[RELOJ] Offset servidor-local: %+.3fs ± %.3fs (%s/%s muestras, RTT mínimo %.0f ms)",
+        valor,
+        incertidumbre,
+        usadas,
+        total,
+        rtt_min * 1000,
+    )
@@ -2,6 +2,7 @@ import logging
 import math
 import random
 import threading
+import time
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 from pathlib import Path
@@ -10,7 +11,13 @@ import pandas as pd
 from playwright.sync_api import sync_playwright
 
 import config
+import metricas
+import perfilado
+import reloj
 from booking import intentar_sacar_turno
+from cola import ColaReintentos, Cuenta
+from recursos import GobernadorRecursos
+from supervisor import NavegadorAgotado, SupervisorNavegador, Watchdog
 
 df_lock = threading.Lock()
 
@@ -25,11 +32,13 @@ def _target_slot_for_idx(idx: int) -> int:
 
 def _crear_contexto(browser):
     ua = random.choice(config.USER_AGENTS)
-    return browser.new_context(
+    context = browser.new_context(
         user_agent=ua,
         viewport={"width": 1300, "height": 900},
         accept_downloads=True,
     )
+    context.on("response", reloj.registrar_respuesta)
+    return context
 
 
 def _setup_logging() -> Path:
@@ -76,57 +85,138 @@ def _guardar_turno(df: pd.DataFrame, idx: int):
 
 
 def _procesar_fila(
-    browser,
+    supervisor: SupervisorNavegador,
+    gobernador: GobernadorRecursos,
     df: pd.DataFrame,
-    idx: int,
-    usuario: str,
-    password: str,
-    turno_conseguido: str,
-):
-    if not usuario or not password:
-        logging.warning("[FILA %s] Usuario/Contraseña vacíos, saltando...", idx)
-        return
-    if turno_conseguido.upper() == "SI":
-        logging.info("[%s] Ya tiene turno (Turno Conseguido = SI), saltando...", usuario)
-        return
-
+    cuenta: Cuenta,
+) -> str:
+    idx, usuario, password = cuenta.idx, cuenta.usuario, cuenta.password
+
+    # El navegador se lanza recién después de la admisión, así también queda gobernado.
+    gobernador.admitir(
+        usuario,
+        supervisor.nombre,
+        necesita_navegador=supervisor.browser is None,
+        al_esperar=supervisor.cerrar,
+    )
     logging.info("=== Intentando sacar turno para usuario: %s ===", usuario)
 
-    context = _crear_contexto(browser)
-    page = context.new_page()
-
-    try:
-        target_slot = _target_slot_for_idx(idx)
-        resultado = intentar_sacar_turno(page, usuario, password, target_slot=target_slot)
-    except Exception as err:  # noqa: BLE001
-        logging.exception("[%s] EXCEPCIÓN no controlada: %s", usuario, err)
-        resultado = "ERROR"
-    finally:
-        page.close()
-        context.close()
-
+    context = None
+    perfil = None
+    inicio = time.time()
+    resultado = "ERROR"
+    # Heartbeat, intento y limpieza bajo el watchdog: cualquiera puede colgarse con el navegador.
+    with supervisor.intento():
+        try:
+            browser = supervisor.navegador()
+            context = _crear_contexto(browser)
+            perfil = perfilado.PerfiladoIntento(context, usuario, cuenta.intentos + 1)
+            page = context.new_page()
+            target_slot = _target_slot_for_idx(idx)
+            resultado = intentar_sacar_turno(page, usuario, password, target_slot=target_slot)
+        except NavegadorAgotado:
+            raise
+        except Exception as err:  # noqa: BLE001
+            logging.exception("[%s] EXCEPCIÓN no controlada: %s", usuario, err)
+            resultado = "ERROR"
+        finally:
+            supervisor.latir()
+            if perfil is not None:
+                perfil.finalizar(time.time() - inicio, resultado)
+            if context is not None:
+                try:
+                    context.close()
+                except Exception as err:  # noqa: BLE001
+                    logging.warning("[%s] No se pudo cerrar el contexto: %s", usuario, err)
+            gobernador.liberar(usuario)
+
+    if not supervisor.conectado():
+        if resultado == "OK":
+            # La reserva se confirmó antes de la caída: se guarda igual, nunca se reintenta.
+            logging.error("[%s] Navegador caído tras confirmar la reserva; se guarda el turno igual", usuario)
+        else:
+            # Los helpers tragan excepciones: con el navegador caído el resultado no es confiable.
+            resultado = "NAVEGADOR_CAIDO"
+
+    metricas.fin_intento(usuario, resultado)
     logging.info("[%s] Resultado: %s", usuario, resultado)
 
     if resultado == "OK":
         _guardar_turno(df, idx)
+    return resultado
+
+
+def _worker(gobernador: GobernadorRecursos, watchdog: Watchdog, df: pd.DataFrame, cola: ColaReintentos):
+    """Procesa cuentas de la cola con su propio Playwright: la API sync no se comparte entre hilos."""
+    with sync_playwright() as p:
+        supervisor = SupervisorNavegador(p, threading.current_thread().name, gobernador)
+        watchdog.registrar(supervisor)
+        try:
+            while (cuenta := cola.obtener()) is not None:
+                resultado = "NAVEGADOR_CAIDO"
+                try:
+                    resultado = _procesar_fila(supervisor, gobernador, df, cuenta)
+                except NavegadorAgotado as err:
+                    logging.error("Worker abandonado, se agotaron los reinicios del navegador: %s", err)
+                    break
+                finally:
+                    cola.terminar(cuenta, resultado)
+                if supervisor.browser is not None and gobernador.sobran_navegadores():
+                    logging.info("[%s] El gobernador bajó el límite; cerrando navegador ocioso", supervisor.nombre)
+                    supervisor.cerrar()
+        finally:
+            watchdog.quitar(supervisor)
+            supervisor.cerrar()
 
 
 def run():
-    _setup_logging()
+    log_file = _setup_logging()
+    perfilado.iniciar_corrida(log_file.stem)
 
     df = _cargar_excel()
     if df is None:
         return
 
-    with sync_playwright() as p:
-        browser = p.chromium.launch(headless=False)
-
-        for idx, row in df.iterrows():
-            usuario = str(row.get(config.COL_USUARIO, "")).strip()
-            password = str(row.get(config.COL_PASSWORD, "")).strip()
-            turno_conseguido = str(row.get(config.COL_TURNO, "")).strip()
-            _procesar_fila(browser, df, idx, usuario, password, turno_conseguido)
-
-        browser.close()
-
+    cola = ColaReintentos()
+    n_cuentas = 0
+    for idx, row in df.iterrows():
+        usuario = str(row.get(config.COL_USUARIO, "")).strip()
+        password = str(row.get(config.COL_PASSWORD, "")).strip()
+        turno_conseguido = str(row.get(config.COL_TURNO, "")).strip()
+        if not usuario or not password:
+            logging.warning("[FILA %s] Usuario/Contraseña vacíos, saltando...", idx)
+            continue
+        if turno_conseguido.upper() == "SI":
+            logging.info("[%s] Ya tiene turno (Turno Conseguido = SI), saltando...", usuario)
+            continue
+        cola.agregar(Cuenta(idx, usuario, password))
+        n_cuentas += 1
+
+    gobernador = GobernadorRecursos(config.MAX_CONCURRENT_BOTS)
+    gobernador.iniciar()
+    metricas.iniciar_servidor(gobernador)
+    watchdog = Watchdog()
+    watchdog.iniciar()
+    try:
+        n_workers = max(1, min(config.MAX_CONCURRENT_BOTS, n_cuentas))
+        with ThreadPoolExecutor(max_workers=n_workers, thread_name_prefix="bot") as executor:
+            futures = [executor.submit(_worker, gobernador, watchdog, df, cola) for _ in range(n_workers)]
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except Exception as err:  # noqa: BLE001
+                    logging.exception("Worker terminó con error: %s", err)
+    finally:
+        watchdog.detener()
+        gobernador.detener()
+        metricas.detener_servidor()
+        reloj.log_estado()
+
+    pendientes = cola.pendientes()
+    if pendientes:
+        logging.error(
+            "Quedaron %s cuentas sin procesar (todos los workers se abandonaron): %s",
+            len(pendientes),
+            ", ".join(cuenta.usuario for cuenta in pendientes),
+        )
     logging.info("Proceso terminado. Excel actualizado.")
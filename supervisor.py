@@ -0,0 +1,254 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+import psutil
+
+import config
+
+# Los lanzamientos se serializan para poder atribuir a cada navegador los procesos nuevos.
+_lock_lanzamiento = threading.Lock()
+# Última señal de avance por hilo: cada llamada a Playwright de los helpers que volvió, con
+# o sin éxito. La lee el watchdog.
+_lock_progreso = threading.Lock()
+_progreso: dict[int, float] = {}
+
+
+class NavegadorAgotado(RuntimeError):
+    """El navegador de un worker se cayó más veces que SUPERVISOR_MAX_REINICIOS."""
+
+
+def registrar_progreso():
+    """Señal de avance del hilo actual: una llamada a Playwright volvió, aunque sea por timeout."""
+    with _lock_progreso:
+        _progreso[threading.get_ident()] = time.time()
+
+
+def ultimo_progreso(hilo: int) -> float:
+    with _lock_progreso:
+        return _progreso.get(hilo, 0.0)
+
+
+def _pids_hijos() -> set[int]:
+    try:
+        return {hijo.pid for hijo in psutil.Process().children(recursive=True)}
+    except psutil.Error:
+        return set()
+
+
+def _es_chromium(nombre: str) -> bool:
+    nombre = nombre.lower()
+    return "chrom" in nombre or "headless_shell" in nombre
+
+
+class SupervisorNavegador:
+    """Dueño del navegador de un worker: heartbeat, relanzamiento y límite de reinicios.
+
+    Se usa siempre desde el hilo del worker (la API sync de Playwright no se comparte);
+    el `Watchdog` sólo lee `latido`/`ocupado` y mata procesos, no toca objetos de Playwright.
+    """
+
+    def __init__(self, playwright, nombre: str, gobernador=None):
+        self.nombre = nombre
+        self.browser = None
+        self.reinicios = 0
+        self.ocupado = False
+        self.latido = time.time()
+        self._playwright = playwright
+        self._gobernador = gobernador
+        self._hilo = threading.get_ident()
+        self._pids: set[int] = set()
+        self._caido = False
+
+    def lanzar(self):
+        with _lock_lanzamiento:
+            antes = _pids_hijos()
+            self.browser = self._playwright.chromium.launch(headless=False)
+            nuevos = _pids_hijos() - antes
+        self._pids = self._raices(nuevos)
+        self._caido = False
+        self.browser.on("disconnected", lambda _: self._marcar_caido())
+        self.latir()
+        logging.info("[%s] Navegador lanzado (pids %s)", self.nombre, sorted(self._pids))
+        if self._gobernador is not None:
+            self._gobernador.registrar_navegador(self.nombre, self._pids)
+
+    @property
+    def vivo(self) -> bool:
+        """Chequeo sin llamadas a Playwright, seguro desde otros hilos."""
+        return self.browser is not None and not self._caido
+
+    def conectado(self) -> bool:
+        return self.vivo and self.browser.is_connected()
+
+    def sano(self) -> bool:
+        """Heartbeat con ida y vuelta al navegador: abre y cierra un contexto vacío."""
+        if not self.conectado():
+            return False
+        try:
+            contexto = self.browser.new_context()
+            contexto.close()
+            return True
+        except Exception as err:  # noqa: BLE001
+            logging.warning("[%s] Heartbeat del navegador falló: %s", self.nombre, err)
+            return False
+
+    def navegador(self):
+        """Devuelve un navegador sano, relanzándolo si hace falta."""
+        if self.browser is None:
+            self._lanzar_contando_fallos()
+        elif not self.sano():
+            self.relanzar()
+        return self.browser
+
+    def relanzar(self):
+        self._contar_reinicio()
+        self._cerrar_navegador()
+        self._lanzar_contando_fallos()
+
+    def _lanzar_contando_fallos(self):
+        """Lanza el navegador; cada lanzamiento fallido cuenta como un reinicio."""
+        while True:
+            try:
+                self.lanzar()
+                return
+            except Exception as err:  # noqa: BLE001
+                logging.error("[%s] No se pudo lanzar el navegador: %s", self.nombre, err)
+                self._cerrar_navegador()
+                self._contar_reinicio()
+
+    def _contar_reinicio(self):
+        if self.reinicios >= config.SUPERVISOR_MAX_REINICIOS:
+            raise NavegadorAgotado(f"{self.nombre}: {self.reinicios} reinicios")
+        self.reinicios += 1
+        logging.warning(
+            "[%s] Relanzando navegador (reinicio %s/%s)", self.nombre, self.reinicios, config.SUPERVISOR_MAX_REINICIOS
+        )
+
+    def latir(self):
+        """Progreso explícito (p.ej. antes de la limpieza de un intento)."""
+        self.latido = time.time()
+
+    @contextmanager
+    def intento(self):
+        """Marca al worker como ocupado para que el watchdog vigile su progreso.
+
+        Tiene que envolver todo lo que habla con el navegador, heartbeat y limpieza incluidos.
+        """
+        self.latir()
+        self.ocupado = True
+        try:
+            yield
+        finally:
+            self.ocupado = False
+
+    def ultimo_progreso(self) -> float:
+        return max(self.latido, ultimo_progreso(self._hilo))
+
+    def matar(self, motivo: str):
+        """Mata el árbol de procesos del navegador; la llamada bloqueada del worker falla y sigue."""
+        logging.error("[%s] Watchdog: %s; matando navegador (pids %s)", self.nombre, motivo, sorted(self._pids))
+        for pid in self._pids & _pids_hijos():
+            try:
+                raiz = psutil.Process(pid)
+                procesos = raiz.children(recursive=True) + [raiz]
+            except psutil.NoSuchProcess:
+                continue
+            for proc in procesos:
+                try:
+                    proc.kill()
+                except psutil.NoSuchProcess:
+                    continue
+        self._caido = True
+
+    def cerrar(self):
+        self._cerrar_navegador()
+
+    def _cerrar_navegador(self):
+        if self.browser is not None:
+            try:
+                self.browser.close()
+            except Exception as err:  # noqa: BLE001
+                logging.debug("[%s] Error cerrando navegador: %s", self.nombre, err)
+        # Sólo procesos que siguen siendo hijos nuestros: el pid pudo haberse reutilizado.
+        for pid in self._pids & _pids_hijos():
+            try:
+                psutil.Process(pid).kill()
+            except psutil.NoSuchProcess:
+                continue
+        self.browser = None
+        self._pids = set()
+        if self._gobernador is not None:
+            self._gobernador.quitar_navegador(self.nombre)
+
+    def _marcar_caido(self):
+        self._caido = True
+        logging.warning("[%s] Navegador desconectado", self.nombre)
+
+    @staticmethod
+    def _raices(pids: set[int]) -> set[int]:
+        """Procesos principales del navegador: los Chromium nuevos cuyo padre no es otro Chromium.
+
+        Filtra el driver de Playwright (node) que otro worker haya arrancado justo durante el
+        lanzamiento, y los renderers de otros navegadores.
+        """
+        raices = set()
+        for pid in pids:
+            try:
+                proc = psutil.Process(pid)
+                if not _es_chromium(proc.name()):
+                    continue
+                padre = proc.parent()
+            except psutil.Error:
+                continue
+            if padre is None or padre.pid in pids:
+                continue
+            try:
+                nombre_padre = padre.name()
+            except psutil.Error:
+                nombre_padre = ""
+            if _es_chromium(nombre_padre):
+                continue
+            raices.add(pid)
+        return raices
+
+
+class Watchdog:
+    """Hilo que mata el navegador de un worker ocupado que no progresa hace SUPERVISOR_WATCHDOG_SEG."""
+
+    def __init__(self):
+        self._supervisores: list[SupervisorNavegador] = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._hilo: threading.Thread | None = None
+
+    def registrar(self, supervisor: SupervisorNavegador):
+        with self._lock:
+            self._supervisores.append(supervisor)
+
+    def quitar(self, supervisor: SupervisorNavegador):
+        with self._lock:
+            if supervisor in self._supervisores:
+                self._supervisores.remove(supervisor)
+
+    def iniciar(self):
+        self._hilo = threading.Thread(target=self._loop, name="watchdog", daemon=True)
+        self._hilo.start()
+
+    def detener(self):
+        self._stop.set()
+        if self._hilo:
+            self._hilo.join(timeout=5)
+
+    def _loop(self):
+        while not self._stop.wait(config.SUPERVISOR_WATCHDOG_INTERVALO_SEG):
+            ahora = time.time()
+            with self._lock:
+                supervisores = list(self._supervisores)
+            for supervisor in supervisores:
+                if not supervisor.ocupado or not supervisor.vivo:
+                    continue
+                quieto = ahora - supervisor.ultimo_progreso()
+                if quieto > config.SUPERVISOR_WATCHDOG_SEG:
+                    supervisor.matar(f"sin progreso hace {quieto:.0f}s")
@@ -6,12 +6,15 @@ from datetime import datetime, timedelta
 from playwright.sync_api import TimeoutError as PlaywrightTimeoutError
 
 import config
+import metricas
+import reloj
+import supervisor
 
 
 def calcular_proximo_horario_turnera(now: datetime | None = None) -> datetime:
-    """Devuelve el próximo datetime en el que se abre la turnera según TURNERA_SLOTS."""
+    """Devuelve el próximo datetime en el que se abre la turnera según TURNERA_SLOTS (hora del servidor)."""
     if now is None:
-        now = datetime.now()
+        now = reloj.ahora_servidor()
 
     candidatos = []
     for h, m in config.TURNERA_SLOTS:
@@ -29,9 +32,10 @@ def calcular_proximo_horario_turnera(now: datetime | None = None) -> datetime:
 
 
 def esperar_hasta(target: datetime):
-    """Bloquea el proceso hasta el datetime target."""
+    """Bloquea el proceso hasta el datetime target, medido con la hora estimada del servidor."""
+    reloj.log_estado()
     while True:
-        now = datetime.now()
+        now = reloj.ahora_servidor()
         if now >= target:
             break
         diff = (target - now).total_seconds()
@@ -40,7 +44,17 @@ def esperar_hasta(target: datetime):
         elif diff > 10:
             time.sleep(5)
         else:
-            time.sleep(0.5)
+            time.sleep(min(0.5, diff))
+
+
+def _selector_hit(selector: str):
+    metricas.selector_hit(selector)
+    supervisor.registrar_progreso()
+
+
+def _selector_miss(selectores):
+    metricas.selector_miss(selectores)
+    supervisor.registrar_progreso()
 
 
 def _log_exception(usuario: str, msg: str, err: Exception):
@@ -50,8 +64,10 @@ def _log_exception(usuario: str, msg: str, err: Exception):
 def _safe_click(page, selector: str, usuario: str, timeout: int = 30000, optional: bool = False) -> bool:
     try:
         page.click(selector, timeout=timeout)
+        _selector_hit(selector)
         return True
     except PlaywrightTimeoutError:
+        _selector_miss(selector)
         if optional:
             logging.info("[%s] Elemento opcional no encontrado: %s", usuario, selector)
         else:
@@ -67,12 +83,15 @@ def _wait_selector(page, selector, usuario: str, timeout: int = 30000) -> bool:
     for sel in selectors:
         try:
             page.wait_for_selector(sel, timeout=timeout)
+            _selector_hit(sel)
             return True
         except PlaywrightTimeoutError:
+            supervisor.registrar_progreso()
             continue
         except Exception as err:  # noqa: BLE001
             _log_exception(usuario, f"Error esperando selector {sel}", err)
             continue
+    _selector_miss(selectors)
     logging.warning("[%s] No se encontró selector: %s", usuario, selectors)
     return False
 
@@ -86,18 +105,24 @@ def _click_first_available(page, selectors, usuario: str, timeout: int = 30000)
 
 
 def _click_first_available_any_frame(page, selectors, usuario: str, timeout: int = 30000) -> bool:
-    frames = [("page", page)] + [(f"frame:{idx}", frame) for idx, frame in enumerate(page.frames)]
+    # page.frames incluye el frame principal, que ya se prueba como "page".
+    frames = [("page", page)] + [
+        (f"frame:{idx}", frame) for idx, frame in enumerate(page.frames) if frame != page.main_frame
+    ]
     for frame_name, frame in frames:
         for selector in selectors:
             try:
                 frame.click(selector, timeout=timeout)
                 logging.info("[%s] Click en '%s' dentro de %s", usuario, selector, frame_name)
+                _selector_hit(selector)
                 return True
             except PlaywrightTimeoutError:
+                supervisor.registrar_progreso()
                 continue
             except Exception as err:  # noqa: BLE001
                 _log_exception(usuario, f"Error click en {selector} ({frame_name})", err)
                 continue
+    _selector_miss(selectors)
     logging.warning("[%s] No se pudo clickear con ningún selector en ningún frame: %s", usuario, selectors)
     return False
 
@@ -122,13 +147,16 @@ def _fill_first_available_any_frame(page, selectors, value: str, usuario: str) -
                 frame.click(selector, timeout=3000)
                 frame.fill(selector, value, timeout=5000)
                 logging.info("[%s] Fill '%s' en frame %s", usuario, selector, frame.url)
+                _selector_hit(selector)
                 return True
             except PlaywrightTimeoutError:
+                supervisor.registrar_progreso()
                 logging.debug("[%s] Selector no disponible aún: %s en frame %s", usuario, selector, frame.url)
                 continue
             except Exception as err:  # noqa: BLE001
                 _log_exception(usuario, f"Error llenando {selector} ({frame.url})", err)
                 continue
+    _selector_miss(sels)
     logging.warning("[%s] No se pudo llenar ningún selector: %s", usuario, selectors)
     return False
 
@@ -138,6 +166,7 @@ def _wait_for_loading_end(page, usuario: str, timeout_ms: int = 20000) -> bool:
     loaders = config.SELECTORES["loaders"]
 
     while time.time() < deadline:
+        supervisor.registrar_progreso()
         loader_found = False
         for frame in page.frames:
             for sel in loaders:
@@ -169,10 +198,13 @@ def _wait_for_any_frame_selector(page, selectors, usuario: str, timeout_ms: int
             for sel in sels:
                 try:
                     if frame.query_selector(sel):
+                        _selector_hit(sel)
                         return True
                 except Exception:
                     continue
+        supervisor.registrar_progreso()
         time.sleep(0.3)
+    _selector_miss(sels)
     logging.warning("[%s] Timeout esperando selectores %s en algún frame", usuario, sels)
     return False
 
@@ -194,8 +226,10 @@ def _wait_fill_in_frame(frame, selectors, value: str, usuario: str, timeout_ms:
                 frame.click(selector, timeout=2000)
                 frame.fill(selector, value, timeout=5000)
                 logging.info("[%s] Fill '%s' en frame %s", usuario, selector, frame.url)
+                _selector_hit(selector)
                 return True
             except PlaywrightTimeoutError:
+                supervisor.registrar_progreso()
                 try:
                     handle = frame.query_selector(selector)
                     if handle:
@@ -205,6 +239,7 @@ def _wait_fill_in_frame(frame, selectors, value: str, usuario: str, timeout_ms:
                             value,
                         )
                         logging.info("[%s] Force-filled '%s' en frame %s", usuario, selector, frame.url)
+                        _selector_hit(selector)
                         return True
                 except Exception:
                     pass
@@ -213,6 +248,7 @@ def _wait_fill_in_frame(frame, selectors, value: str, usuario: str, timeout_ms:
                 _log_exception(usuario, f"Error llenando {selector} ({frame.url})", err)
                 continue
         time.sleep(0.3)
+    _selector_miss(sels)
     logging.warning("[%s] No se pudo llenar selectores en frame %s: %s", usuario, frame.url, sels)
     return False
 